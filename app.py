@@ -15,14 +15,23 @@ Description:
 """
 
 import os
-import json
 import sqlite3
 import base64
+import atexit
+import gzip
+import hashlib
+import hmac
+import functools
 import logging
-from abc import ABC, abstractmethod
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Generator, Any
+from urllib.parse import quote
+from typing import Dict, List, Optional, Generator, Any, Protocol
 
 # Third-party imports
 from flask import (
@@ -35,16 +44,25 @@ from flask import (
     send_file,
     url_for
 )
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
-# Configure Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure Logging: request threads only enqueue records; a QueueListener thread does the stream I/O
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # registered first, so it runs last and drains shutdown logs
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # the stream handler adds the prefix
+logging.basicConfig(level=logging.INFO, handlers=[_log_queue_handler])
 logger = logging.getLogger("WALLE_Core")
 
 # Load environment variables
@@ -56,6 +74,15 @@ load_dotenv()
 
 MUSIC_DIRECTORY = Path(os.getenv("MUSIC_DIRECTORY", "/Music")).resolve()
 ALLOWED_AUDIO_EXTENSIONS = {'.mp3', '.ogg'}
+AUDIO_MIME_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg"
+}
+AUDIO_CACHE_MAX_AGE = 86400
+# Internal nginx location aliased to MUSIC_DIRECTORY (e.g. "/_protected_music/"); empty = Flask serves files
+MUSIC_ACCEL_REDIRECT_PREFIX = os.getenv("MUSIC_ACCEL_REDIRECT_PREFIX", "").strip()
+# Apache/lighttpd (mod_xsendfile): send_file emits an X-Sendfile header instead of streaming bytes
+USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "false").lower() in ("1", "true", "yes")
 
 if not MUSIC_DIRECTORY.exists():
     logger.warning(f"🎵 Music directory '{MUSIC_DIRECTORY}' does not exist. Audio routes will be limited.")
@@ -68,6 +95,8 @@ class SecurityService:
     """
     Handles AES-256-GCM encryption and decryption for sensitive data.
     """
+
+    DECRYPTION_FAILED = "[Encrypted Data / Decryption Failed]"
     
     def __init__(self, key_str: Optional[str] = None):
         """
@@ -77,7 +106,15 @@ class SecurityService:
             key_str (str): Base64 encoded 32-byte key. If None, loads from env or generates new.
         """
         self.key = self._load_or_generate_key(key_str)
+        # Built once: the AESGCM instance holds the expanded key schedule and is
+        # shared (thread-safely) by every encrypt/decrypt call.
         self.aesgcm = AESGCM(self.key)
+        # Separate subkey for fingerprints stored next to the ciphertext, so they can be
+        # neither brute-forced nor compared across databases without the key.
+        self.mac_key = hmac.new(self.key, b"WALL-E fingerprint v1", hashlib.sha256).digest()
+        # Bounded ciphertext -> plaintext cache so repeated chat loads skip AES work
+        cache_size = int(os.getenv('DECRYPT_CACHE_SIZE', '4096'))
+        self._decrypt_cached = functools.lru_cache(maxsize=cache_size)(self._decrypt_uncached)
 
     def _load_or_generate_key(self, key_str: Optional[str]) -> bytes:
         """Loads key from env or generates a valid AES-256 key."""
@@ -94,7 +131,7 @@ class SecurityService:
         print(f"\n🔑 NEW GENERATED KEY (Save this to .env): {base64.b64encode(new_key).decode('utf-8')}\n")
         return new_key
 
-    def encrypt(self, plain_text: str) -> str:
+    def encrypt_bytes(self, plain_text: str) -> bytes:
         """
         Encrypts a string using AES-256-GCM.
         
@@ -102,19 +139,111 @@ class SecurityService:
             plain_text (str): The text to encrypt.
             
         Returns:
-            str: Base64 encoded string containing 'nonce + ciphertext'.
+            bytes: Raw 'nonce + ciphertext' (empty for empty input).
         """
         if not plain_text:
-            return ""
+            return b""
         try:
+            # AESGCM's one-shot call already runs OpenSSL's pipelined EVP GCM; the
+            # streaming hazmat Cipher(AES, GCM) path measured slower at every size.
             nonce = os.urandom(12)
             data = plain_text.encode('utf-8')
-            ciphertext = self.aesgcm.encrypt(nonce, data, None)
-            return base64.b64encode(nonce + ciphertext).decode('utf-8')
+            return nonce + self.aesgcm.encrypt(nonce, data, None)
         except Exception as e:
             logger.error(f"Encryption error: {e}")
             raise e
 
+    def encrypt(self, plain_text: str) -> str:
+        """
+        Encrypts a string using AES-256-GCM.
+        
+        Args:
+            plain_text (str): The text to encrypt.
+            
+        Returns:
+            str: Base64 encoded string containing 'nonce + ciphertext'.
+        """
+        if not plain_text:
+            return ""
+        return base64.b64encode(self.encrypt_bytes(plain_text)).decode('utf-8')
+
+    def encrypt_many_bytes(self, plain_texts: List[str]) -> List[bytes]:
+        """
+        Encrypts a batch of strings with a single nonce pool.
+        
+        Args:
+            plain_texts (List[str]): Texts to encrypt.
+            
+        Returns:
+            List[bytes]: Raw 'nonce + ciphertext' values, in input order.
+        """
+        if not plain_texts:
+            return []
+        try:
+            encrypt = self.aesgcm.encrypt
+            pool = os.urandom(12 * len(plain_texts))
+            results = []
+            for i, text in enumerate(plain_texts):
+                if not text:
+                    results.append(b"")
+                    continue
+                nonce = pool[i * 12:(i + 1) * 12]
+                results.append(nonce + encrypt(nonce, text.encode('utf-8'), None))
+            return results
+        except Exception as e:
+            logger.error(f"Batch encryption error: {e}")
+            raise e
+
+    def encrypt_many(self, plain_texts: List[str]) -> List[str]:
+        """Base64 variant of `encrypt_many_bytes` for text-only stores (e.g. Supabase REST)."""
+        b64encode = base64.b64encode
+        return [b64encode(raw).decode('utf-8') for raw in self.encrypt_many_bytes(plain_texts)]
+
+    def decrypt_bytes(self, raw_data: bytes) -> str:
+        """
+        Decrypts raw 'nonce + ciphertext' bytes using AES-256-GCM.
+        Results are served from the LRU cache when the same ciphertext was seen before.
+        
+        Args:
+            raw_data (bytes): The encrypted bytes.
+            
+        Returns:
+            str: Decrypted plain text.
+        """
+        if not raw_data:
+            return ""
+        if isinstance(raw_data, str):
+            # Legacy non-base64 TEXT rows that the BLOB migration left as-is
+            logger.error("Decryption error: message content is not encrypted bytes")
+            return self.DECRYPTION_FAILED
+        return self._decrypt_cached(bytes(raw_data))
+
+    def _decrypt_uncached(self, raw_data: bytes) -> str:
+        """Performs the actual AES-GCM decryption (wrapped by the LRU cache)."""
+        try:
+            decrypted_data = self.aesgcm.decrypt(raw_data[:12], raw_data[12:], None)
+            return decrypted_data.decode('utf-8')
+        except Exception as e:
+            logger.error(f"Decryption error (Possible key mismatch or data corruption): {e}")
+            return self.DECRYPTION_FAILED
+
+    def fingerprint(self, data: bytes) -> str:
+        """Keyed BLAKE2b MAC of `data` as hex; safe to store alongside encrypted content."""
+        return hashlib.blake2b(data, key=self.mac_key, digest_size=32).hexdigest()
+
+    def clear_decrypt_cache(self):
+        """Drops every cached plaintext (e.g. after a chat is deleted)."""
+        self._decrypt_cached.cache_clear()
+
+    def decrypt_many_bytes(self, raw_values: List[bytes]) -> List[str]:
+        """
+        Decrypts a batch of raw 'nonce + ciphertext' values in input order.
+        Runs inline: AES-GCM on chat-sized messages costs ~1 us each, well
+        below thread-pool dispatch overhead.
+        """
+        decrypt_bytes = self.decrypt_bytes
+        return [decrypt_bytes(raw) for raw in raw_values]
+
     def decrypt(self, encrypted_text: str) -> str:
         """
         Decrypts a Base64 encoded string using AES-256-GCM.
@@ -129,13 +258,15 @@ class SecurityService:
             return ""
         try:
             raw_data = base64.b64decode(encrypted_text)
-            nonce = raw_data[:12]
-            ciphertext = raw_data[12:]
-            decrypted_data = self.aesgcm.decrypt(nonce, ciphertext, None)
-            return decrypted_data.decode('utf-8')
         except Exception as e:
-            logger.error(f"Decryption error (Possible key mismatch or data corruption): {e}")
-            return "[Encrypted Data / Decryption Failed]"
+            logger.error(f"Decryption error (Invalid base64 payload): {e}")
+            return self.DECRYPTION_FAILED
+        return self.decrypt_bytes(raw_data)
+
+    def decrypt_many(self, encrypted_texts: List[str]) -> List[str]:
+        """Base64 variant of `decrypt_many_bytes` for text-only stores (e.g. Supabase REST)."""
+        decrypt = self.decrypt
+        return [decrypt(text) for text in encrypted_texts]
 
 security_service = SecurityService()
 
@@ -175,158 +306,578 @@ class ConfigManager:
         for d in dirs:
             os.makedirs(d, exist_ok=True)
 
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _parse_json_file(path: str, mtime: float) -> Dict:
+        """Parses a JSON file; cached per (path, mtime) so unchanged files are never re-read."""
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+
     @staticmethod
     def load_json(path: str, default: Dict) -> Dict:
-        """Loads JSON config with fallback to default."""
+        """Loads JSON config with fallback to default (cached until the file changes)."""
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            return ConfigManager._parse_json_file(path, os.path.getmtime(path))
+        except (FileNotFoundError, orjson.JSONDecodeError):
             logger.warning(f"Config not found or invalid at {path}. Creating default.")
             ConfigManager.save_json(path, default)
             return default
 
+    @staticmethod
+    def reload():
+        """Drops every cached config so the next load_json re-reads from disk."""
+        ConfigManager._parse_json_file.cache_clear()
+
     @staticmethod
     def save_json(path: str, data: Dict):
         """Saves dictionary to JSON file."""
         try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with open(path, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
         except Exception as e:
             logger.error(f"Failed to save config to {path}: {e}")
 
+# ==========================================
+# 🌐 Outbound HTTP
+# ==========================================
+
+HTTP_POOL_CONNECTIONS = 16
+HTTP_POOL_MAXSIZE = 64
+# Fail fast when a host is unreachable; read timeouts are set per call
+HTTP_CONNECT_TIMEOUT = 5
+
+def create_http_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    """
+    Builds a keep-alive session with a tuned connection pool and retry policy.
+    
+    Retries cover connection errors and 429/502/503/504 on idempotent methods;
+    urllib3 never re-sends a POST/PATCH after it reached the server.
+    
+    Args:
+        headers (dict): Default headers sent with every request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=(429, 502, 503, 504))
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
 # ==========================================
 # 💾 Database Services (SQLite / Supabase)
 # ==========================================
 
-class BaseDatabaseService(ABC):
-    """Abstract base for database providers."""
+class DatabaseService(Protocol):
+    """Structural interface for database providers (type-checking only, no runtime cost)."""
 
-    @abstractmethod
-    def save_chat(self, chat_data: Dict[str, Any]):
-        """Persists (upserts) chat metadata and messages."""
+    def save_chat(self, chat_data: Dict[str, Any], bulk: bool = False):
+        """Persists (upserts) chat metadata and messages. `bulk` hints at a large import."""
 
-    @abstractmethod
     def get_chat(self, chat_id: str) -> Optional[Dict]:
         """Returns a single chat with decrypted messages."""
 
-    @abstractmethod
+    def get_chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """Returns chat metadata without its messages, or None if missing."""
+
+    def update_chat_meta(self, chat_id: str, title: Optional[str] = None,
+                         pinned: Optional[bool] = None, model: Optional[str] = None) -> Optional[Dict]:
+        """Updates chat metadata only; returns the chat row or None if missing."""
+
+    def append_messages(self, chat_id: str, messages: List[Dict[str, Any]]) -> Optional[int]:
+        """Appends messages to an existing chat; returns how many, or None if the chat is missing."""
+
     def get_all_chats(self) -> List[Dict]:
         """Lists all chats with metadata."""
 
-    @abstractmethod
     def delete_chat(self, chat_id: str):
         """Deletes a chat and its messages."""
 
+    def data_version(self) -> Optional[int]:
+        """Token that changes whenever the stored data may have changed, or None if unknown."""
 
-class SQLiteDatabaseService(BaseDatabaseService):
+
+class SQLiteDatabaseService:
     """Handles SQLite database operations with integrated encryption."""
     
     DB_PATH = 'data/chats.db'
 
+    # Per-connection settings, applied once to every new pooled connection
+    PRAGMAS = (
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "mmap_size=268435456",
+        "cache_size=-65536",
+        "foreign_keys=ON",
+        # Truncate the -wal file back to 64 MiB after checkpoints instead of letting it keep its peak size
+        "journal_size_limit=67108864"
+    )
+
+    # Prepared-statement cache per connection (sqlite3 default: 128)
+    CACHED_STATEMENTS = 256
+
+    # Stored in PRAGMA user_version; bump it whenever _migrate_schema gains a step
+    SCHEMA_VERSION = 1
+    # sqlite3.connect's default timeout, and the longer wait used while another
+    # worker holds the lock for a (possibly slow) schema migration
+    BUSY_TIMEOUT_MS = 5000
+    MIGRATION_BUSY_TIMEOUT_MS = 120000
+
+    # Messages encrypted + inserted per executemany call in save_chat
+    INSERT_BATCH_SIZE = 500
+
+    # 'ordinal' is the message's position in its chat (0-based, unique per chat)
+    MESSAGES_COLUMNS = '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content BLOB NOT NULL,
+        content_hash TEXT,
+        ordinal INTEGER,
+        liked INTEGER,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
+    '''
+
+    # Hot-path statements. sqlite3 caches prepared statements per connection keyed by SQL
+    # text, so with the long-lived per-thread connections each is parsed once per thread.
+    SQL_UPSERT_CHAT = '''
+        INSERT INTO chats (id, title, model, pinned, created_at, messages_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            title = excluded.title,
+            model = excluded.model,
+            pinned = excluded.pinned,
+            created_at = excluded.created_at,
+            messages_hash = excluded.messages_hash
+    '''
+    SQL_GET_MESSAGES_HASH = 'SELECT messages_hash FROM chats WHERE id = ?'
+    SQL_CLEAR_MESSAGES_HASH = 'UPDATE chats SET messages_hash = NULL WHERE id = ?'
+    SQL_SELECT_MESSAGE_STATE = 'SELECT content_hash, liked FROM messages WHERE chat_id = ? ORDER BY ordinal'
+    SQL_UPDATE_LIKED = 'UPDATE messages SET liked = ? WHERE chat_id = ? AND ordinal = ?'
+    SQL_DELETE_MESSAGES_FROM = 'DELETE FROM messages WHERE chat_id = ? AND ordinal >= ?'
+    SQL_INSERT_MESSAGE = '''
+        INSERT INTO messages (chat_id, role, content, content_hash, ordinal, liked, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    SQL_GET_CHAT = '''
+        SELECT c.id, c.title, c.model, c.pinned, c.created_at,
+               m.role, m.content, m.liked, m.timestamp
+        FROM chats c
+        LEFT JOIN messages m ON m.chat_id = c.id
+        WHERE c.id = ?
+        ORDER BY m.ordinal
+    '''
+    SQL_UPDATE_CHAT_META = '''
+        UPDATE chats
+        SET title = COALESCE(?, title),
+            model = COALESCE(?, model),
+            pinned = COALESCE(?, pinned)
+        WHERE id = ?
+    '''
+    SQL_UPDATE_CHAT_META_RETURNING = SQL_UPDATE_CHAT_META + 'RETURNING id, title, model, pinned, created_at'
+    SQL_GET_CHAT_META = 'SELECT id, title, model, pinned, created_at FROM chats WHERE id = ?'
+    # UPDATE ... RETURNING needs SQLite 3.35+; older libraries take the UPDATE + SELECT path
+    SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+    SQL_NEXT_ORDINAL = 'SELECT COALESCE(MAX(ordinal) + 1, 0) FROM messages WHERE chat_id = ?'
+    SQL_LIST_CHATS = '''
+        SELECT id, title, model, pinned, created_at, message_count
+        FROM chats
+        ORDER BY created_at DESC
+    '''
+    SQL_DELETE_CHAT = 'DELETE FROM chats WHERE id = ?'
+
     def __init__(self):
+        self._local = threading.local()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
+        # SQLite allows one writer at a time anyway: every write goes through this one
+        # connection under a mutex instead of contending for the file lock.
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.Lock()
+        # Dedicated connection for PRAGMA data_version, which only reflects commits made
+        # by *other* connections (this process's writer as well as other workers)
+        self._version_conn: Optional[sqlite3.Connection] = None
+        self._version_lock = threading.Lock()
         self._init_db()
+        atexit.register(self.close)
+
+    def _open_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.DB_PATH,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self.CACHED_STATEMENTS
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    @contextmanager
+    def _writer(self) -> Generator[sqlite3.Connection, None, None]:
+        """Holds the write lock and yields the shared writer connection (created lazily)."""
+        with self._writer_lock:
+            if self._writer_conn is None:
+                self._writer_conn = self._open_connection()
+            yield self._writer_conn
 
     def _get_connection(self) -> sqlite3.Connection:
-        """Creates a database connection with Row factory."""
-        conn = sqlite3.connect(self.DB_PATH)
-        conn.row_factory = sqlite3.Row
+        """Returns the long-lived read connection of the current thread (created lazily)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._reap_dead_connections()
+                self._connections[threading.current_thread()] = conn
         return conn
 
+    def _reap_dead_connections(self):
+        """Closes connections whose owning thread has exited (caller holds the lock)."""
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            self._close_quietly(self._connections.pop(thread))
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Closes every pooled connection (called on interpreter shutdown)."""
+        with self._connections_lock:
+            for conn in self._connections.values():
+                self._close_quietly(conn)
+            self._connections.clear()
+        self._local = threading.local()
+        with self._writer_lock:
+            if self._writer_conn is not None:
+                self._close_quietly(self._writer_conn)
+                self._writer_conn = None
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._close_quietly(self._version_conn)
+                self._version_conn = None
+
     def _init_db(self):
         """Initializes database schema."""
         try:
-            with self._get_connection() as conn:
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS chats (
-                        id TEXT PRIMARY KEY,
-                        title TEXT NOT NULL,
-                        model TEXT NOT NULL,
-                        pinned INTEGER DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id TEXT NOT NULL,
-                        role TEXT NOT NULL,
-                        content TEXT NOT NULL,
-                        liked INTEGER,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
-                    )
-                ''')
+            conn = self._get_connection()
+            # journal_mode is persistent in the database file, so it is set once here.
+            # WAL lets readers run alongside the single writer.
+            journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if journal_mode.lower() != 'wal':
+                logger.warning(f"⚠️ SQLite WAL mode unavailable; journal_mode is '{journal_mode}'.")
+
+            # Every gunicorn worker runs this at boot: the schema is checked and migrated
+            # under one write lock, so a second worker waits and then finds it up to date.
+            conn.execute(f"PRAGMA busy_timeout = {self.MIGRATION_BUSY_TIMEOUT_MS}")
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                    self._migrate_schema(conn)
+                    conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+
+            # Give the planner statistics for these indexes: full ANALYZE the first time,
+            # afterwards PRAGMA optimize only re-analyzes tables whose stats went stale.
+            has_stats = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            ).fetchone()
+            conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
             logger.info("✅ SQLite schema initialized.")
         except Exception as e:
             logger.critical(f"Database initialization failed: {e}")
 
-    def save_chat(self, chat_data: Dict[str, Any]):
-        """Saves or updates a chat and its messages (Encrypts content)."""
-        conn = self._get_connection()
-        try:
-            conn.execute('''
-                INSERT OR REPLACE INTO chats (id, title, model, pinned, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                chat_data['id'],
-                chat_data.get('title', 'New Chat'),
-                chat_data.get('model', 'unknown'),
-                int(chat_data.get('pinned', False)),
-                chat_data.get('created_at', datetime.now().isoformat())
-            ))
-
-            conn.execute('DELETE FROM messages WHERE chat_id = ?', (chat_data['id'],))
+    def _migrate_schema(self, conn: sqlite3.Connection):
+        """
+        Creates the schema or upgrades an older one to SCHEMA_VERSION. Runs inside the
+        caller's BEGIN IMMEDIATE transaction, so every step commits or none does. Each
+        step is idempotent, which also lets it repair databases migrated half-way.
+        """
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chats (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                model TEXT NOT NULL,
+                pinned INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute(f"CREATE TABLE IF NOT EXISTS messages ({self.MESSAGES_COLUMNS})")
+        self._delete_orphan_messages(conn)
+        self._ensure_column(conn, 'messages', 'content_hash', 'TEXT')
+        self._migrate_message_ordinals(conn)
+        self._ensure_column(conn, 'chats', 'message_count', 'INTEGER NOT NULL DEFAULT 0')
+        self._ensure_column(conn, 'chats', 'messages_hash', 'TEXT')
+        self._migrate_content_to_blob(conn)
+        # Before the count backfill, which would otherwise scan messages once per chat
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_chat_ordinal ON messages(chat_id, ordinal)')
+        self._ensure_message_count_triggers(conn)
+        # Every message lookup is served by (chat_id, ordinal); the old timestamp index only slowed inserts
+        conn.execute('DROP INDEX IF EXISTS idx_messages_chat_ts')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chats_created ON chats(created_at DESC)')
+
+    @staticmethod
+    def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> bool:
+        """Adds a column to an existing table if an older schema lacks it. Returns True if added."""
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column in existing:
+            return False
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        logger.info(f"🛠️ Migrated SQLite schema: {table}.{column} added.")
+        return True
 
+    @staticmethod
+    def _delete_orphan_messages(conn: sqlite3.Connection):
+        """
+        Removes messages whose chat no longer exists. Older versions ran without
+        foreign_keys=ON, so deleting a chat left its messages behind; with enforcement
+        on, copying those rows (see `_migrate_content_to_blob`) would fail.
+        """
+        deleted = conn.execute(
+            "DELETE FROM messages WHERE chat_id NOT IN (SELECT id FROM chats)"
+        ).rowcount
+        if deleted:
+            logger.info(f"🛠️ Removed {deleted} orphaned message(s) left by deleted chats.")
+
+    def _migrate_message_ordinals(self, conn: sqlite3.Connection):
+        """
+        Adds messages.ordinal to older schemas and numbers every chat that still has
+        NULL ordinals by insertion order (id). Keyed on `ordinal IS NULL`, so it also
+        repairs databases where an earlier backfill never completed.
+        """
+        self._ensure_column(conn, 'messages', 'ordinal', 'INTEGER')
+        # Renumber whole chats: rows appended after a partial backfill already took
+        # ordinals from 0 and would collide with the legacy rows.
+        conn.execute('''
+            UPDATE messages SET ordinal = NULL
+            WHERE chat_id IN (SELECT chat_id FROM messages WHERE ordinal IS NULL)
+        ''')
+        rows = conn.execute("SELECT id, chat_id FROM messages WHERE ordinal IS NULL ORDER BY chat_id, id")
+        numbered = []
+        current_chat, ordinal = None, 0
+        for row in rows:
+            if row['chat_id'] != current_chat:
+                current_chat, ordinal = row['chat_id'], 0
+            numbered.append((ordinal, row['id']))
+            ordinal += 1
+        if numbered:
+            conn.executemany("UPDATE messages SET ordinal = ? WHERE id = ?", numbered)
+            logger.info(f"🛠️ Migrated SQLite schema: ordinals backfilled for {len(numbered)} message(s).")
+
+    @staticmethod
+    def _ensure_message_count_triggers(conn: sqlite3.Connection):
+        """
+        Keeps chats.message_count in sync on every message INSERT/DELETE, whatever the
+        write path. Counts are backfilled whenever the triggers are (re)created.
+        """
+        existing = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'messages_count_ai'"
+        ).fetchone()
+        if existing:
+            return
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_count_ai AFTER INSERT ON messages
+            BEGIN
+                UPDATE chats SET message_count = message_count + 1 WHERE id = NEW.chat_id;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_count_ad AFTER DELETE ON messages
+            BEGIN
+                UPDATE chats SET message_count = message_count - 1 WHERE id = OLD.chat_id;
+            END
+        ''')
+        conn.execute('''
+            UPDATE chats
+            SET message_count = (SELECT COUNT(*) FROM messages WHERE messages.chat_id = chats.id)
+        ''')
+        logger.info("🛠️ SQLite message_count triggers installed.")
+
+    def _migrate_content_to_blob(self, conn: sqlite3.Connection):
+        """
+        One-shot migration from the legacy TEXT (base64) content column to raw BLOBs.
+        Rebuilds `messages` with the BLOB declaration and base64-decodes old rows.
+        """
+        columns = {row['name']: row['type'].upper() for row in conn.execute("PRAGMA table_info(messages)")}
+        if columns.get('content') == 'BLOB':
+            return
+        conn.execute("ALTER TABLE messages RENAME TO messages_legacy")
+        conn.execute(f"CREATE TABLE messages ({self.MESSAGES_COLUMNS})")
+        conn.execute('''
+            INSERT INTO messages (id, chat_id, role, content, content_hash, ordinal, liked, timestamp)
+            SELECT id, chat_id, role, content, content_hash, ordinal, liked, timestamp FROM messages_legacy
+        ''')
+        conn.execute("DROP TABLE messages_legacy")
+
+        converted = []
+        for row in conn.execute("SELECT id, content FROM messages WHERE typeof(content) = 'text'"):
+            try:
+                converted.append((base64.b64decode(row['content'], validate=True), row['id']))
+            except ValueError:
+                logger.warning(f"Message {row['id']} has non-base64 content; left as-is.")
+        if converted:
+            conn.executemany("UPDATE messages SET content = ? WHERE id = ?", converted)
+        logger.info(f"🛠️ Migrated SQLite schema: messages.content is now BLOB ({len(converted)} rows converted).")
+
+    @staticmethod
+    def _messages_digest(messages: List[Dict[str, Any]]) -> str:
+        """Keyed fingerprint of a whole incoming message list (every field, key-order independent)."""
+        return security_service.fingerprint(orjson.dumps(messages, option=orjson.OPT_SORT_KEYS))
+
+    @staticmethod
+    def _message_hash(msg: Dict[str, Any]) -> str:
+        """Keyed fingerprint of a message's role and plaintext content."""
+        return security_service.fingerprint(f"{msg['role']}\0{msg['content']}".encode('utf-8'))
+
+    def save_chat(self, chat_data: Dict[str, Any], bulk: bool = False):
+        """
+        Saves or updates a chat and its messages (Encrypts content).
+        
+        If the incoming message list is byte-for-byte the one last saved
+        (chats.messages_hash), messages are not touched at all. Otherwise stored
+        messages are diffed by ordinal and content hash (see `_sync_messages`).
+        
+        Everything runs in one BEGIN IMMEDIATE/COMMIT transaction. With
+        `bulk=True` the commit skips fsync (synchronous=OFF) for large imports.
+        """
+        with self._writer() as conn:
+            try:
+                if bulk:
+                    conn.execute("PRAGMA synchronous=OFF")
+                conn.execute("BEGIN IMMEDIATE")
+                now_iso = datetime.now().isoformat()
+                messages = chat_data.get('messages', [])
+                messages_digest = self._messages_digest(messages)
+                stored_chat = conn.execute(self.SQL_GET_MESSAGES_HASH, (chat_data['id'],)).fetchone()
+                conn.execute(self.SQL_UPSERT_CHAT, (
+                    chat_data['id'],
+                    chat_data.get('title', 'New Chat'),
+                    chat_data.get('model', 'unknown'),
+                    int(chat_data.get('pinned', False)),
+                    chat_data.get('created_at', now_iso),
+                    messages_digest
+                ))
+
+                if stored_chat is None or stored_chat['messages_hash'] != messages_digest:
+                    self._sync_messages(conn, chat_data['id'], messages, now_iso)
+
+                conn.execute("COMMIT")
+                logger.info(f"💾 Chat saved (SQLite): {chat_data['id']}")
+
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.error(f"Error saving chat: {e}")
+                raise e
+            finally:
+                if bulk:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _sync_messages(self, conn: sqlite3.Connection, chat_id: str, messages: List[Dict[str, Any]], now_iso: str):
+        """
+        Diffs stored messages against the incoming list by ordinal and content hash: the
+        unchanged prefix is kept as-is (only 'liked' flags are refreshed), and only ordinals
+        from the first divergence onward are deleted and re-encrypted. For the usual
+        append-only chat this encrypts just the tail.
+        """
+        hashes = [self._message_hash(msg) for msg in messages]
+        stored = conn.execute(self.SQL_SELECT_MESSAGE_STATE, (chat_id,)).fetchall()
+
+        unchanged = 0
+        for row, msg_hash in zip(stored, hashes):
+            if row['content_hash'] != msg_hash:
+                break
+            unchanged += 1
+
+        liked_updates = [
+            (messages[i].get('liked'), chat_id, i)
+            for i in range(unchanged)
+            if messages[i].get('liked') != stored[i]['liked']
+        ]
+        if liked_updates:
+            conn.executemany(self.SQL_UPDATE_LIKED, liked_updates)
+
+        if unchanged < len(stored):
+            conn.execute(self.SQL_DELETE_MESSAGES_FROM, (chat_id, unchanged))
+
+        self._insert_messages(conn, chat_id, messages[unchanged:], unchanged, hashes[unchanged:], now_iso)
+
+    def _insert_messages(self, conn: sqlite3.Connection, chat_id: str, messages: List[Dict[str, Any]],
+                         first_ordinal: int, hashes: List[str], now_iso: str):
+        """Encrypts and inserts messages at consecutive ordinals (caller holds the transaction)."""
+        # Fixed-size batches keep memory and per-call latency flat on huge chats
+        for start in range(0, len(messages), self.INSERT_BATCH_SIZE):
+            batch = messages[start:start + self.INSERT_BATCH_SIZE]
+            encrypted_contents = security_service.encrypt_many_bytes([msg['content'] for msg in batch])
             messages_to_insert = []
-            for msg in chat_data.get('messages', []):
-                encrypted_content = security_service.encrypt(msg['content'])
+            for offset, (msg, encrypted_content) in enumerate(zip(batch, encrypted_contents), start):
                 messages_to_insert.append((
-                    chat_data['id'],
+                    chat_id,
                     msg['role'],
                     encrypted_content,
+                    hashes[offset],
+                    first_ordinal + offset,
                     msg.get('liked'),
-                    msg.get('timestamp', datetime.now().isoformat())
+                    msg.get('timestamp', now_iso)
                 ))
+            conn.executemany(self.SQL_INSERT_MESSAGE, messages_to_insert)
 
-            if messages_to_insert:
-                conn.executemany('''
-                    INSERT INTO messages (chat_id, role, content, liked, timestamp)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', messages_to_insert)
-
-            conn.commit()
-            logger.info(f"💾 Chat saved (SQLite): {chat_data['id']}")
-
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error saving chat: {e}")
-            raise e
-        finally:
-            conn.close()
+    def append_messages(self, chat_id: str, messages: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Appends messages after the chat's last one without reading or rewriting stored rows.
+        Returns the number of appended messages, or None if the chat does not exist.
+        """
+        with self._writer() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if not conn.execute(self.SQL_GET_CHAT_META, (chat_id,)).fetchone():
+                    conn.execute("ROLLBACK")
+                    return None
+                next_ordinal = conn.execute(self.SQL_NEXT_ORDINAL, (chat_id,)).fetchone()[0]
+                hashes = [self._message_hash(msg) for msg in messages]
+                self._insert_messages(conn, chat_id, messages, next_ordinal, hashes, datetime.now().isoformat())
+                # The stored list no longer matches the last full save
+                conn.execute(self.SQL_CLEAR_MESSAGES_HASH, (chat_id,))
+                conn.execute("COMMIT")
+                logger.info(f"💾 {len(messages)} message(s) appended (SQLite): {chat_id}")
+                return len(messages)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.error(f"Error appending messages: {e}")
+                raise e
 
     def get_chat(self, chat_id: str) -> Optional[Dict]:
-        """Retrieves a chat and decrypts its messages."""
+        """Retrieves a chat and decrypts its messages (one JOIN query, one batch decrypt)."""
         conn = self._get_connection()
         try:
-            chat_row = conn.execute('SELECT * FROM chats WHERE id = ?', (chat_id,)).fetchone()
-            if not chat_row:
+            rows = conn.execute(self.SQL_GET_CHAT, (chat_id,)).fetchall()
+            if not rows:
                 return None
 
-            msgs_rows = conn.execute(
-                'SELECT role, content, liked, timestamp FROM messages WHERE chat_id = ? ORDER BY timestamp',
-                (chat_id,)
-            ).fetchall()
-
-            messages = []
-            for row in msgs_rows:
-                decrypted_content = security_service.decrypt(row['content'])
-                messages.append({
-                    'role': row['role'],
-                    'content': decrypted_content,
-                    'liked': row['liked'],
-                    'timestamp': row['timestamp']
-                })
+            chat_row = rows[0]
+            msgs_rows = [row for row in rows if row['role'] is not None]
+            decrypted_contents = security_service.decrypt_many_bytes([row['content'] for row in msgs_rows])
+            messages = [{
+                'role': row['role'],
+                'content': decrypted_content,
+                'liked': row['liked'],
+                'timestamp': row['timestamp']
+            } for row, decrypted_content in zip(msgs_rows, decrypted_contents)]
 
             return {
                 'id': chat_row['id'],
@@ -339,20 +890,42 @@ class SQLiteDatabaseService(BaseDatabaseService):
         except Exception as e:
             logger.error(f"Error loading chat {chat_id}: {e}")
             return None
-        finally:
-            conn.close()
+
+    def update_chat_meta(self, chat_id: str, title: Optional[str] = None,
+                         pinned: Optional[bool] = None, model: Optional[str] = None) -> Optional[Dict]:
+        """Updates title/pinned/model and reads the row back in one UPDATE ... RETURNING (messages untouched)."""
+        if title is None and pinned is None and model is None:
+            # Nothing to change: a plain read, without taking the write lock
+            return self.get_chat_meta(chat_id)
+        params = (title, model, None if pinned is None else int(pinned), chat_id)
+        with self._writer() as conn:
+            if self.SUPPORTS_RETURNING:
+                row = conn.execute(self.SQL_UPDATE_CHAT_META_RETURNING, params).fetchone()
+            else:
+                conn.execute(self.SQL_UPDATE_CHAT_META, params)
+                row = conn.execute(self.SQL_GET_CHAT_META, (chat_id,)).fetchone()
+        return self._chat_meta_from_row(row) if row else None
+
+    def get_chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """Reads only the chats row (no messages are loaded or decrypted)."""
+        row = self._get_connection().execute(self.SQL_GET_CHAT_META, (chat_id,)).fetchone()
+        return self._chat_meta_from_row(row) if row else None
+
+    @staticmethod
+    def _chat_meta_from_row(row: sqlite3.Row) -> Dict:
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'model': row['model'],
+            'pinned': bool(row['pinned']),
+            'created_at': row['created_at']
+        }
 
     def get_all_chats(self) -> List[Dict]:
         """Retrieves metadata for all chats."""
         conn = self._get_connection()
         try:
-            cursor = conn.execute('''
-                SELECT c.*, COUNT(m.id) as message_count
-                FROM chats c
-                LEFT JOIN messages m ON c.id = m.chat_id
-                GROUP BY c.id
-                ORDER BY c.created_at DESC
-            ''')
+            cursor = conn.execute(self.SQL_LIST_CHATS)
             
             return [{
                 'id': row['id'],
@@ -365,33 +938,56 @@ class SQLiteDatabaseService(BaseDatabaseService):
         except Exception as e:
             logger.error(f"Error listing chats: {e}")
             return []
-        finally:
-            conn.close()
 
     def delete_chat(self, chat_id: str):
         """Deletes a chat and its messages."""
-        with self._get_connection() as conn:
-            conn.execute('DELETE FROM chats WHERE id = ?', (chat_id,))
-            conn.commit()
+        with self._writer() as conn:
+            conn.execute(self.SQL_DELETE_CHAT, (chat_id,))
         logger.info(f"🗑️ Chat deleted (SQLite): {chat_id}")
 
+    def data_version(self) -> Optional[int]:
+        """PRAGMA data_version: changes whenever any process commits to the database file."""
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = self._open_connection()
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+class SupabaseError(RuntimeError):
+    """Raised when a Supabase REST call fails; carries the HTTP status when there is one."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
 
-class SupabaseDatabaseService(BaseDatabaseService):
+
+class SupabaseDatabaseService:
     """Handles Supabase persistence via REST API (`requests`-based) with encryption."""
 
+    # Postgres function (see supabase/save_chat_with_messages.sql) doing the whole save in one transaction
+    SAVE_CHAT_RPC = "rpc/save_chat_with_messages"
+    # Rows per POST on the multi-request fallback path
+    INSERT_BATCH_SIZE = 500
+    # Chat list reads the trigger-maintained column (supabase/message_count.sql) when installed,
+    # otherwise PostgREST aggregates messages(count) per chat
+    CHAT_LIST_SELECT = "id,title,model,pinned,created_at,message_count"
+    CHAT_LIST_SELECT_AGGREGATE = "id,title,model,pinned,created_at,message_count:messages(count)"
+
     def __init__(self):
         self.supabase_url = os.getenv("SUPABASE_URL", "").rstrip("/")
         self.api_key = os.getenv("SUPABASE_API_KEY")
         if not self.supabase_url or not self.api_key:
             raise ValueError("Supabase credentials (SUPABASE_URL & SUPABASE_API_KEY) are required.")
         self.rest_url = self._build_rest_url(self.supabase_url)
-        self.session = requests.Session()
+        self.session = create_http_session()
         self.base_headers = {
             "apikey": self.api_key,
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+        self.rpc_available = True
+        self.message_count_column = True
         logger.info("✅ Supabase service initialized.")
 
     @staticmethod
@@ -413,27 +1009,61 @@ class SupabaseDatabaseService(BaseDatabaseService):
         """Executes an HTTP request and raises informative errors on failure."""
         url = f"{self.rest_url}/{path.lstrip('/')}"
         headers = kwargs.pop('headers', self.base_headers)
+        if 'json' in kwargs:
+            kwargs['data'] = orjson.dumps(kwargs.pop('json'))
         try:
-            response = self.session.request(method=method.upper(), url=url, headers=headers, timeout=30, **kwargs)
+            response = self.session.request(
+                method=method.upper(),
+                url=url,
+                headers=headers,
+                timeout=(HTTP_CONNECT_TIMEOUT, 30),
+                **kwargs
+            )
         except requests.RequestException as exc:
             logger.error(f"Supabase network error: {exc}")
-            raise RuntimeError("Supabase request failed") from exc
+            raise SupabaseError("Supabase request failed") from exc
 
         if not response.ok:
             logger.error("Supabase responded with %s: %s", response.status_code, response.text)
-            raise RuntimeError(f"Supabase error ({response.status_code})")
+            raise SupabaseError(f"Supabase error ({response.status_code})", response.status_code)
         return response
 
-    def save_chat(self, chat_data: Dict[str, Any]):
-        """Upserts chat and messages on Supabase (encrypted content)."""
+    def _request_json(self, method: str, path: str, **kwargs) -> Any:
+        """Like `_request`, but decodes the JSON response body with orjson."""
+        return orjson.loads(self._request(method, path, **kwargs).content)
+
+    def save_chat(self, chat_data: Dict[str, Any], bulk: bool = False):
+        """
+        Upserts chat and messages on Supabase (encrypted content). `bulk` has no effect here.
+        Uses the save_chat_with_messages RPC (one atomic round-trip); if the function is not
+        installed on the project, falls back to the three-request upsert/delete/insert path.
+        """
+        now_iso = datetime.now().isoformat()
         chat_payload = {
             "id": chat_data['id'],
             "title": chat_data.get('title', 'New Chat'),
             "model": chat_data.get('model', 'unknown'),
             "pinned": bool(chat_data.get('pinned', False)),
-            "created_at": chat_data.get('created_at', datetime.now().isoformat())
+            "created_at": chat_data.get('created_at', now_iso)
         }
         try:
+            messages_to_insert = self._encrypt_message_rows(chat_data['id'], chat_data.get('messages', []), now_iso)
+
+            if self.rpc_available:
+                try:
+                    self._request(
+                        "post",
+                        self.SAVE_CHAT_RPC,
+                        json={"chat": chat_payload, "msgs": messages_to_insert}
+                    )
+                    logger.info(f"💾 Chat saved (Supabase RPC): {chat_data['id']}")
+                    return
+                except SupabaseError as exc:
+                    if exc.status_code != 404:
+                        raise
+                    self.rpc_available = False
+                    logger.warning("Supabase RPC save_chat_with_messages not found; using multi-request saves.")
+
             self._request(
                 "post",
                 "chats",
@@ -443,64 +1073,90 @@ class SupabaseDatabaseService(BaseDatabaseService):
             )
 
             self._request("delete", "messages", params={"chat_id": f"eq.{chat_data['id']}"})
-
-            messages_to_insert = []
-            for msg in chat_data.get('messages', []):
-                encrypted_content = security_service.encrypt(msg['content'])
-                messages_to_insert.append({
-                    "chat_id": chat_data['id'],
-                    "role": msg['role'],
-                    "content": encrypted_content,
-                    "liked": msg.get('liked'),
-                    "timestamp": msg.get('timestamp', datetime.now().isoformat())
-                })
-
-            if messages_to_insert:
-                self._request(
-                    "post",
-                    "messages",
-                    headers=self._with_prefer("return=minimal"),
-                    json=messages_to_insert
-                )
+            self._insert_message_rows(messages_to_insert)
 
             logger.info(f"💾 Chat saved (Supabase): {chat_data['id']}")
         except Exception as exc:
             logger.error(f"Supabase save failed: {exc}")
             raise
 
+    @staticmethod
+    def _encrypt_message_rows(chat_id: str, messages: List[Dict[str, Any]], now_iso: str) -> List[Dict[str, Any]]:
+        """Builds `messages` table rows with batch-encrypted content."""
+        encrypted_contents = security_service.encrypt_many([msg['content'] for msg in messages])
+        return [
+            {
+                "chat_id": chat_id,
+                "role": msg['role'],
+                "content": encrypted_content,
+                "liked": msg.get('liked'),
+                "timestamp": msg.get('timestamp', now_iso)
+            }
+            for msg, encrypted_content in zip(messages, encrypted_contents)
+        ]
+
+    def _insert_message_rows(self, rows: List[Dict[str, Any]]):
+        """Inserts message rows, chunked so a huge chat never exceeds PostgREST request-size limits."""
+        for start in range(0, len(rows), self.INSERT_BATCH_SIZE):
+            self._request(
+                "post",
+                "messages",
+                headers=self._with_prefer("return=minimal"),
+                json=rows[start:start + self.INSERT_BATCH_SIZE]
+            )
+
+    def append_messages(self, chat_id: str, messages: List[Dict[str, Any]]) -> Optional[int]:
+        """Inserts only the new messages (no delete/rewrite). None if the chat does not exist."""
+        try:
+            exists = self._request_json(
+                "get",
+                "chats",
+                params={"id": f"eq.{chat_id}", "select": "id", "limit": 1}
+            )
+            if not exists:
+                return None
+            self._insert_message_rows(self._encrypt_message_rows(chat_id, messages, datetime.now().isoformat()))
+            logger.info(f"💾 {len(messages)} message(s) appended (Supabase): {chat_id}")
+            return len(messages)
+        except Exception as exc:
+            logger.error(f"Supabase append_messages failed: {exc}")
+            raise
+
     def get_chat(self, chat_id: str) -> Optional[Dict]:
         """Fetches a single chat with decrypted messages from Supabase."""
         try:
-            chat_resp = self._request(
+            chat_resp = self._request_json(
                 "get",
                 "chats",
                 params={"id": f"eq.{chat_id}", "select": "*", "limit": 1}
-            ).json()
+            )
 
             if not chat_resp:
                 return None
 
             chat_row = chat_resp[0]
 
-            messages_resp = self._request(
+            messages_resp = self._request_json(
                 "get",
                 "messages",
                 params={
                     "chat_id": f"eq.{chat_id}",
                     "select": "role,content,liked,timestamp",
-                    "order": "timestamp.asc"
+                    # Messages saved in one batch share a timestamp; id keeps their insertion order
+                    "order": "timestamp.asc,id.asc"
                 }
-            ).json()
+            )
 
-            messages = []
-            for row in messages_resp:
-                decrypted_content = security_service.decrypt(row['content'])
-                messages.append({
+            decrypted_contents = security_service.decrypt_many([row['content'] for row in messages_resp])
+            messages = [
+                {
                     "role": row['role'],
                     "content": decrypted_content,
                     "liked": row.get('liked'),
                     "timestamp": row.get('timestamp')
-                })
+                }
+                for row, decrypted_content in zip(messages_resp, decrypted_contents)
+            ]
 
             return {
                 "id": chat_row['id'],
@@ -514,17 +1170,71 @@ class SupabaseDatabaseService(BaseDatabaseService):
             logger.error(f"Supabase get_chat failed: {exc}")
             return None
 
-    def get_all_chats(self) -> List[Dict]:
-        """Lists chats along with aggregated message counts."""
+    def update_chat_meta(self, chat_id: str, title: Optional[str] = None,
+                         pinned: Optional[bool] = None, model: Optional[str] = None) -> Optional[Dict]:
+        """Patches chat metadata on Supabase without re-sending messages."""
+        fields = {"title": title, "model": model, "pinned": None if pinned is None else bool(pinned)}
+        patch = {key: value for key, value in fields.items() if value is not None}
+        if not patch:
+            return self.get_chat_meta(chat_id)
         try:
-            rows = self._request(
+            rows = self._request_json(
+                "patch",
+                "chats",
+                params={"id": f"eq.{chat_id}", "select": "id,title,model,pinned,created_at"},
+                headers=self._with_prefer("return=representation"),
+                json=patch
+            )
+            return self._chat_meta_from_row(rows[0]) if rows else None
+        except Exception as exc:
+            logger.error(f"Supabase update_chat_meta failed: {exc}")
+            raise
+
+    def get_chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """Fetches only the chats row from Supabase (no messages)."""
+        try:
+            rows = self._request_json(
                 "get",
                 "chats",
-                params={
-                    "select": "id,title,model,pinned,created_at,message_count:messages(count)",
-                    "order": "created_at.desc"
-                }
-            ).json()
+                params={"id": f"eq.{chat_id}", "select": "id,title,model,pinned,created_at", "limit": 1}
+            )
+            return self._chat_meta_from_row(rows[0]) if rows else None
+        except Exception as exc:
+            logger.error(f"Supabase get_chat_meta failed: {exc}")
+            raise
+
+    @staticmethod
+    def _chat_meta_from_row(row: Dict[str, Any]) -> Dict:
+        return {
+            "id": row['id'],
+            "title": row['title'],
+            "model": row['model'],
+            "pinned": bool(row['pinned']),
+            "created_at": row['created_at']
+        }
+
+    def get_all_chats(self) -> List[Dict]:
+        """Lists chats along with their message counts."""
+        try:
+            rows = None
+            if self.message_count_column:
+                try:
+                    rows = self._request_json(
+                        "get",
+                        "chats",
+                        params={"select": self.CHAT_LIST_SELECT, "order": "created_at.desc"}
+                    )
+                except SupabaseError as exc:
+                    if exc.status_code != 400:
+                        raise
+                    self.message_count_column = False
+                    logger.warning("Supabase chats.message_count column not found; aggregating message counts.")
+            if rows is None:
+                rows = self._request_json(
+                    "get",
+                    "chats",
+                    params={"select": self.CHAT_LIST_SELECT_AGGREGATE, "order": "created_at.desc"}
+                )
 
             chats: List[Dict[str, Any]] = []
             for row in rows:
@@ -548,17 +1258,31 @@ class SupabaseDatabaseService(BaseDatabaseService):
             return []
 
     def delete_chat(self, chat_id: str):
-        """Deletes a chat (and ensures messages are removed)."""
+        """
+        Deletes a chat with one request, relying on the messages FK's ON DELETE CASCADE
+        (see supabase/messages_cascade.sql). If the FK still blocks the delete (409),
+        removes the messages first and retries.
+        """
         try:
-            self._request("delete", "messages", params={"chat_id": f"eq.{chat_id}"})
-            self._request("delete", "chats", params={"id": f"eq.{chat_id}"})
+            try:
+                self._request("delete", "chats", params={"id": f"eq.{chat_id}"})
+            except SupabaseError as exc:
+                if exc.status_code != 409:
+                    raise
+                logger.warning("Supabase messages FK lacks ON DELETE CASCADE; deleting messages first.")
+                self._request("delete", "messages", params={"chat_id": f"eq.{chat_id}"})
+                self._request("delete", "chats", params={"id": f"eq.{chat_id}"})
             logger.info(f"🗑️ Chat deleted (Supabase): {chat_id}")
         except Exception as exc:
             logger.error(f"Supabase delete_chat failed: {exc}")
             raise
 
+    def data_version(self) -> Optional[int]:
+        """PostgREST offers no change counter; callers fall back to CHAT_LIST_CACHE_TTL."""
+        return None
 
-def get_database_service() -> BaseDatabaseService:
+
+def get_database_service() -> DatabaseService:
     """
     Returns the correct database service implementation based on env.
     Accepts DB_PROVIDER=sqlite (default) or DB_PROVIDER=supabase.
@@ -574,13 +1298,99 @@ def get_database_service() -> BaseDatabaseService:
     logger.info("Using SQLite backend.")
     return SQLiteDatabaseService()
 
+
+class ChatWriteQueue:
+    """
+    Write-behind queue for chat saves: routes enqueue and answer immediately while a
+    single background thread persists saves in order. Pending saves of the same chat
+    are coalesced (latest wins); `flush` gives readers read-after-write consistency.
+    """
+
+    def __init__(self, service: DatabaseService):
+        self.service = service
+        self._pending: Dict[str, tuple] = {}
+        self._in_flight: Optional[str] = None
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush)
+        logger.info("✅ Write-behind chat saves enabled.")
+
+    def submit(self, chat_data: Dict[str, Any], bulk: bool = False):
+        """Queues a save; replaces any save of the same chat that has not started yet."""
+        chat_id = chat_data['id']
+        with self._cond:
+            already_queued = chat_id in self._pending
+            self._pending[chat_id] = (chat_data, bulk)
+        if not already_queued:
+            self._queue.put(chat_id)
+
+    def flush(self, chat_id: Optional[str] = None, timeout: Optional[float] = 30) -> bool:
+        """Blocks until the chat's (or every) pending save is persisted. False on timeout."""
+        def drained() -> bool:
+            if chat_id is None:
+                return not self._pending and self._in_flight is None
+            return chat_id not in self._pending and self._in_flight != chat_id
+        with self._cond:
+            return self._cond.wait_for(drained, timeout)
+
+    def _run(self):
+        while True:
+            chat_id = self._queue.get()
+            with self._cond:
+                chat_data, bulk = self._pending.pop(chat_id)
+                self._in_flight = chat_id
+            try:
+                self.service.save_chat(chat_data, bulk=bulk)
+            except Exception as exc:
+                logger.error(f"Write-behind save failed for chat {chat_id}: {exc}")
+            finally:
+                with self._cond:
+                    self._in_flight = None
+                    self._cond.notify_all()
+
 # ==========================================
 # 🎵 Audio Helpers
 # ==========================================
 
+MUSIC_INDEX_TTL = 30  # seconds between rescans of MUSIC_DIRECTORY
+
+_music_index: Dict[str, Path] = {}
+_music_index_loaded_at = float('-inf')
+_music_index_lock = threading.Lock()
+
+def _scan_music_directory() -> Dict[str, Path]:
+    """
+    Builds a basename -> resolved path index of playable files in MUSIC_DIRECTORY.
+    Entries (including symlinks) that resolve outside the directory are skipped.
+    """
+    index: Dict[str, Path] = {}
+    if not MUSIC_DIRECTORY.exists():
+        return index
+    with os.scandir(MUSIC_DIRECTORY) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() not in ALLOWED_AUDIO_EXTENSIONS:
+                continue
+            resolved = Path(entry.path).resolve()
+            if resolved.parent != MUSIC_DIRECTORY or not resolved.is_file():
+                continue
+            index[entry.name] = resolved
+    return index
+
+def _get_music_index(force: bool = False) -> Dict[str, Path]:
+    """Returns the cached music index, rescanning once it is older than MUSIC_INDEX_TTL (or when forced)."""
+    global _music_index, _music_index_loaded_at
+    if force or time.monotonic() - _music_index_loaded_at > MUSIC_INDEX_TTL:
+        with _music_index_lock:
+            if force or time.monotonic() - _music_index_loaded_at > MUSIC_INDEX_TTL:
+                _music_index = _scan_music_directory()
+                _music_index_loaded_at = time.monotonic()
+    return _music_index
+
 def _resolve_music_file(filename: str) -> Path:
     """
-    Validates and resolves a requested audio file inside MUSIC_DIRECTORY.
+    Validates a requested audio file against the cached MUSIC_DIRECTORY index.
     
     Args:
         filename (str): Name of the audio file requested by the user.
@@ -590,35 +1400,50 @@ def _resolve_music_file(filename: str) -> Path:
     
     Raises:
         ValueError: If filename or extension is invalid.
-        FileNotFoundError: If the file does not exist.
-        PermissionError: If the resolved path escapes MUSIC_DIRECTORY.
+        FileNotFoundError: If no such file is indexed (this also covers any path
+            outside MUSIC_DIRECTORY, since only plain basenames are indexed).
     """
     cleaned_name = filename.strip()
     if not cleaned_name:
         raise ValueError("Filename is required for audio playback.")
-    candidate = (MUSIC_DIRECTORY / cleaned_name).resolve()
-    if candidate.suffix.lower() not in ALLOWED_AUDIO_EXTENSIONS:
+    if Path(cleaned_name).suffix.lower() not in ALLOWED_AUDIO_EXTENSIONS:
         raise ValueError("Only MP3 and OGG files are allowed.")
-    if not candidate.exists() or not candidate.is_file():
+    candidate = _get_music_index().get(cleaned_name)
+    if candidate is None:
         raise FileNotFoundError(f"Audio file '{cleaned_name}' not found.")
-    try:
-        candidate.relative_to(MUSIC_DIRECTORY)
-    except ValueError as exc:
-        raise PermissionError("Invalid path. Access outside music directory is not allowed.") from exc
     return candidate
 
 def _get_audio_mimetype(file_path: Path) -> str:
     """Maps audio extensions to proper MIME types."""
-    return {
-        ".mp3": "audio/mpeg",
-        ".ogg": "audio/ogg"
-    }.get(file_path.suffix.lower(), "application/octet-stream")
+    return AUDIO_MIME_TYPES.get(file_path.suffix.lower(), "application/octet-stream")
 
 # ==========================================
 # 🚀 Flask Application Setup
 # ==========================================
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (used by jsonify and request.get_json)."""
+
+    OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, option=self.OPTIONS).decode('utf-8')
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        """Serializes straight to bytes, skipping the intermediate str."""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self.OPTIONS),
+            mimetype='application/json'
+        )
+
 app = Flask(__name__, template_folder='templates', static_folder='static')
+app.json = OrjsonProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # Reject runaway uploads before parsing
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
 CORS(app)
 
 ConfigManager.ensure_directories()
@@ -627,8 +1452,127 @@ models_config = ConfigManager.load_json(ConfigManager.MODELS_PATH, ConfigManager
 prompts_config = ConfigManager.load_json(ConfigManager.PROMPTS_PATH, ConfigManager.DEFAULT_PROMPTS)
 
 PROXY_URL = os.getenv('PROXY_URL')
+BULK_SAVE_THRESHOLD = int(os.getenv('BULK_SAVE_THRESHOLD', '200'))
+WRITE_BEHIND_SAVES = os.getenv('WRITE_BEHIND_SAVES', 'false').lower() in ('1', 'true', 'yes')
+# Writes invalidate the cached /api/chats body in this process. On SQLite, commits from
+# other worker processes are caught via data_version; backends without one (Supabase)
+# only cache for this TTL, which is off by default (0) since other workers can write.
+CHAT_LIST_CACHE_TTL = float(os.getenv('CHAT_LIST_CACHE_TTL', '0'))
 PROXY_API_KEY = os.getenv('PROXY_API_KEY')
 
+proxy_session = create_http_session({
+    "Authorization": f"Bearer {PROXY_API_KEY}",
+    "Content-Type": "application/json"
+})
+
+chat_write_queue = ChatWriteQueue(db_service) if WRITE_BEHIND_SAVES else None
+
+_chat_list_body: Optional[bytes] = None
+_chat_list_cached_at = float('-inf')
+_chat_list_data_version: Optional[int] = None
+_chat_list_generation = 0
+_chat_list_lock = threading.Lock()
+
+def _invalidate_chat_list():
+    """Drops the cached chat list; called after every chat write."""
+    global _chat_list_body, _chat_list_generation
+    with _chat_list_lock:
+        _chat_list_body = None
+        _chat_list_generation += 1
+
+def _load_chat_list() -> bytes:
+    """
+    Returns the serialized chat list, from cache while it is fresh: until the backend's
+    data_version moves, or for CHAT_LIST_CACHE_TTL when it has none. A result is only
+    cached if no write invalidated the list while it was being read (generation check).
+    """
+    global _chat_list_body, _chat_list_cached_at, _chat_list_data_version
+    data_version = db_service.data_version()
+    with _chat_list_lock:
+        if _chat_list_body is not None:
+            if data_version is not None:
+                fresh = data_version == _chat_list_data_version
+            else:
+                fresh = time.monotonic() - _chat_list_cached_at < CHAT_LIST_CACHE_TTL
+            if fresh:
+                return _chat_list_body
+        generation = _chat_list_generation
+    _flush_chat_writes()
+    body = orjson.dumps(db_service.get_all_chats(), option=OrjsonProvider.OPTIONS)
+    with _chat_list_lock:
+        if generation == _chat_list_generation:
+            _chat_list_body = body
+            _chat_list_cached_at = time.monotonic()
+            _chat_list_data_version = data_version
+    return body
+
+def _save_chat(chat_data: Dict[str, Any], bulk: bool = False) -> bool:
+    """Saves a chat, through the write-behind queue when enabled. Returns True if queued."""
+    try:
+        if chat_write_queue:
+            chat_write_queue.submit(chat_data, bulk=bulk)
+            return True
+        db_service.save_chat(chat_data, bulk=bulk)
+        return False
+    finally:
+        _invalidate_chat_list()
+
+def _flush_chat_writes(chat_id: Optional[str] = None):
+    """Waits for queued saves (of one chat, or all) before reading or mutating them."""
+    if chat_write_queue and not chat_write_queue.flush(chat_id):
+        logger.warning(f"Timed out waiting for queued chat saves ({chat_id or 'all'}).")
+
+# JSON bodies below this size are sent as-is; gzip framing would outweigh the savings
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 5
+
+# Static JSON bodies, serialized once; _config_body is rebuilt whenever prompts are reloaded
+_api_status_body = orjson.dumps({
+    "status": "WALL•E is online",
+    "version": "2.1.0",
+    "encryption": "AES-256-GCM Enabled",
+    "dynamic_prompts": "Active",
+    "db_provider": os.getenv("DB_PROVIDER", "sqlite"),
+    "music_directory": str(MUSIC_DIRECTORY)
+})
+_config_body = b""
+_config_body_gzip = b""
+
+def _build_config_body():
+    """Serializes (and pre-compresses) the models/prompts config served by /api/config."""
+    global _config_body, _config_body_gzip
+    _config_body = orjson.dumps({
+        "models": models_config,
+        "prompt": prompts_config
+    }, option=OrjsonProvider.OPTIONS)
+    _config_body_gzip = gzip.compress(_config_body, compresslevel=COMPRESS_LEVEL)
+
+def _accepts_gzip() -> bool:
+    """True if the current request accepts gzip (honours q-values, so 'gzip;q=0' refuses it)."""
+    return request.accept_encodings['gzip'] > 0
+
+_build_config_body()
+
+@app.after_request
+def compress_json_response(response: Response) -> Response:
+    """Gzips JSON responses (chat lists, full histories) for clients that accept it."""
+    if (
+        response.mimetype != 'application/json'
+        or response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or not _accepts_gzip()
+    ):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 # ==========================================
 # 🌐 API Routes
 # ==========================================
@@ -639,29 +1583,25 @@ def serve_index():
 
 @app.route('/api')
 def api_status():
-    return jsonify({
-        "status": "WALL•E is online",
-        "version": "2.1.0",
-        "encryption": "AES-256-GCM Enabled",
-        "dynamic_prompts": "Active",
-        "db_provider": os.getenv("DB_PROVIDER", "sqlite"),
-        "music_directory": str(MUSIC_DIRECTORY)
-    })
+    return Response(_api_status_body, mimetype='application/json')
 
 @app.route('/api/config')
 def get_config():
-    return jsonify({
-        "models": models_config,
-        "prompt": prompts_config
-    })
+    if _accepts_gzip():
+        # Served pre-compressed; the Content-Encoding header makes the after_request hook skip it
+        response = Response(_config_body_gzip, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    return Response(_config_body, mimetype='application/json')
 
 @app.route('/api/chats', methods=['GET'])
 def get_chats():
-    chats = db_service.get_all_chats()
-    return jsonify(chats)
+    return Response(_load_chat_list(), mimetype='application/json')
 
 @app.route('/api/chats/<chat_id>', methods=['GET'])
 def get_single_chat(chat_id):
+    _flush_chat_writes(chat_id)
     chat = db_service.get_chat(chat_id)
     if chat:
         return jsonify(chat)
@@ -678,36 +1618,100 @@ def create_chat():
         data.setdefault('model', models_config.get("default_model"))
         data.setdefault('messages', [])
         
-        db_service.save_chat(data)
-        return jsonify(data), 201
+        queued = _save_chat(data, bulk=len(data['messages']) >= BULK_SAVE_THRESHOLD)
+        return jsonify(data), 202 if queued else 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/chats/<chat_id>', methods=['PUT'])
 def update_chat(chat_id):
-    data = request.get_json()
-    existing_chat = db_service.get_chat(chat_id)
-    
-    if not existing_chat:
-        return jsonify({"error": "Chat not found"}), 404
+    data = request.get_json() or {}
     
     try:
-        updated_chat = {**existing_chat, **data}
-        updated_chat['id'] = chat_id
-        
-        db_service.save_chat(updated_chat)
-        return jsonify(updated_chat)
+        # A queued save carries the old metadata; let it land before patching
+        _flush_chat_writes(chat_id)
+
+        # Metadata-only updates (rename/pin/model switch) never touch messages
+        if 'messages' not in data:
+            chat_meta = db_service.update_chat_meta(
+                chat_id,
+                title=data.get('title'),
+                pinned=data.get('pinned'),
+                model=data.get('model')
+            )
+            if not chat_meta:
+                return jsonify({"error": "Chat not found"}), 404
+            _invalidate_chat_list()
+            return jsonify(chat_meta)
+
+        # With messages, the metadata rides along in the same save (one transaction)
+        chat_meta = db_service.get_chat_meta(chat_id)
+        if not chat_meta:
+            return jsonify({"error": "Chat not found"}), 404
+        meta_updates = {
+            field: data[field] for field in ('title', 'pinned', 'model')
+            if data.get(field) is not None
+        }
+        updated_chat = {**chat_meta, **meta_updates, 'messages': data['messages']}
+        queued = _save_chat(updated_chat)
+        return jsonify(updated_chat), 202 if queued else 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/chats/<chat_id>', methods=['DELETE'])
 def delete_chat(chat_id):
     try:
+        _flush_chat_writes(chat_id)
         db_service.delete_chat(chat_id)
+        _invalidate_chat_list()
+        security_service.clear_decrypt_cache()
         return jsonify({"message": "Deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chats/<chat_id>/messages', methods=['POST'])
+def append_chat_messages(chat_id):
+    """
+    Appends new messages to a chat without resending its history.
+    Optional title/pinned/model fields are applied as a metadata update.
+    """
+    data = request.get_json() or {}
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "A non-empty 'messages' list is required."}), 400
+    if not all(
+        isinstance(msg, dict) and isinstance(msg.get('role'), str) and isinstance(msg.get('content'), str)
+        for msg in messages
+    ):
+        return jsonify({"error": "Each message must be an object with string 'role' and 'content'."}), 400
+
+    try:
+        # Queued full saves must land first, or they would overwrite the appended tail
+        _flush_chat_writes(chat_id)
+        if any(field in data for field in ('title', 'pinned', 'model')):
+            chat_meta = db_service.update_chat_meta(
+                chat_id,
+                title=data.get('title'),
+                pinned=data.get('pinned'),
+                model=data.get('model')
+            )
+            if not chat_meta:
+                return jsonify({"error": "Chat not found"}), 404
+        appended = db_service.append_messages(chat_id, messages)
+        _invalidate_chat_list()
+        if appended is None:
+            return jsonify({"error": "Chat not found"}), 404
+        return jsonify({"id": chat_id, "appended": appended}), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/chats/<chat_id>/flush', methods=['POST'])
+def flush_chat(chat_id):
+    """Blocks until queued saves of this chat are persisted (read-after-write for clients)."""
+    if chat_write_queue and not chat_write_queue.flush(chat_id):
+        return jsonify({"error": "Timed out waiting for pending saves."}), 504
+    return jsonify({"status": "flushed", "id": chat_id})
+
 # ==========================================
 # 🎵 Audio Routes
 # ==========================================
@@ -720,14 +1724,17 @@ def list_music():
     if not MUSIC_DIRECTORY.exists():
         return jsonify({"tracks": [], "message": "Music directory not found."})
     
+    # os.scandir hands back DirEntry objects whose type/stat results are cached
     tracks = []
-    for item in MUSIC_DIRECTORY.iterdir():
-        if item.is_file() and item.suffix.lower() in ALLOWED_AUDIO_EXTENSIONS:
-            tracks.append({
-                "filename": item.name,
-                "size_bytes": item.stat().st_size,
-                "mime_type": _get_audio_mimetype(item)
-            })
+    with os.scandir(MUSIC_DIRECTORY) as entries:
+        for entry in entries:
+            extension = os.path.splitext(entry.name)[1].lower()
+            if extension in ALLOWED_AUDIO_EXTENSIONS and entry.is_file():
+                tracks.append({
+                    "filename": entry.name,
+                    "size_bytes": entry.stat().st_size,
+                    "mime_type": AUDIO_MIME_TYPES[extension]
+                })
     return jsonify({"tracks": tracks})
 
 @app.route('/api/music/play', methods=['GET'])
@@ -741,11 +1748,22 @@ def play_music():
         return jsonify({"error": "filename query parameter is required."}), 400
     try:
         audio_file = _resolve_music_file(filename)
+        mimetype = _get_audio_mimetype(audio_file)
+        if MUSIC_ACCEL_REDIRECT_PREFIX:
+            # Hand the transfer (ranges included) to nginx and free the worker immediately
+            relative_path = quote(audio_file.relative_to(MUSIC_DIRECTORY).as_posix())
+            return Response(headers={
+                'X-Accel-Redirect': f"{MUSIC_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative_path}",
+                'Content-Type': mimetype
+            })
+        # conditional=True enables Range/304 handling; the WSGI file_wrapper uses sendfile(2) where available
         return send_file(
             audio_file,
-            mimetype=_get_audio_mimetype(audio_file),
+            mimetype=mimetype,
             as_attachment=False,
             conditional=True,
+            etag=True,
+            max_age=AUDIO_CACHE_MAX_AGE,
             download_name=audio_file.name
         )
     except FileNotFoundError:
@@ -756,10 +1774,67 @@ def play_music():
         logger.error(f"Audio streaming failed: {exc}")
         return jsonify({"error": "Internal error while streaming audio."}), 500
 
+@app.route('/api/music/refresh', methods=['POST'])
+def refresh_music():
+    """
+    Rescans MUSIC_DIRECTORY immediately instead of waiting for the index TTL
+    (e.g. right after tracks were added or removed).
+    """
+    try:
+        index = _get_music_index(force=True)
+        return jsonify({"status": "refreshed", "tracks": len(index)})
+    except Exception as exc:
+        logger.error(f"Music index refresh failed: {exc}")
+        return jsonify({"error": "Failed to refresh music index."}), 500
+
 # ==========================================
 # 🤖 AI Chat Logic (Streaming & Proxy)
 # ==========================================
 
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+# Pre-built system messages per model category, rebuilt only by reload_config()
+_system_messages: Dict[str, Dict[str, str]] = {}
+_fallback_system_message: Dict[str, str] = {}
+
+def _build_system_messages():
+    """Builds the system message for every prompt category from prompts_config."""
+    global _system_messages, _fallback_system_message
+    _system_messages = {
+        category: {"role": "system", "content": prompt}
+        for category, prompt in prompts_config.get("model_specific_prompts", {}).items()
+    }
+    _fallback_system_message = {
+        "role": "system",
+        "content": prompts_config.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
+    }
+
+def reload_config():
+    """Re-reads the models and prompts configs from disk and rebuilds everything derived from them."""
+    global models_config, prompts_config
+    ConfigManager.reload()
+    models_config = ConfigManager.load_json(ConfigManager.MODELS_PATH, ConfigManager.DEFAULT_MODELS)
+    prompts_config = ConfigManager.load_json(ConfigManager.PROMPTS_PATH, ConfigManager.DEFAULT_PROMPTS)
+    _build_system_messages()
+    _build_config_body()
+    logger.info("🧠 Models and system prompts reloaded.")
+
+_build_system_messages()
+
+@app.route('/api/config/reload', methods=['POST'])
+def reload_config_endpoint():
+    """
+    Applies edits to static/models/config.json and static/prompts/system.json without a
+    restart. Only the worker process serving this request reloads; restart gunicorn
+    (or send it SIGHUP) to refresh every worker.
+    """
+    try:
+        reload_config()
+        return jsonify({"status": "reloaded", "models": len(models_config.get("available_models", {}))})
+    except Exception as exc:
+        logger.error(f"Config reload failed: {exc}")
+        return jsonify({"error": "Failed to reload configuration."}), 500
+
 def _prepare_proxy_payload(data: Dict, stream: bool) -> Dict:
     """
     Prepares the payload for the AI Proxy.
@@ -773,22 +1848,19 @@ def _prepare_proxy_payload(data: Dict, stream: bool) -> Dict:
     current_model_config = available_models.get(model_name, {})
     model_category = current_model_config.get("category", "general")
     
-    specific_prompts = prompts_config.get("model_specific_prompts", {})
-    fallback_prompt = prompts_config.get("system_prompt", "You are a helpful AI assistant.")
-    
-    if model_category in specific_prompts:
-        system_prompt = specific_prompts[model_category]
-        logger.info(f"🧠 Selected Prompt: '{model_category}' for model '{model_name}'")
+    system_message = _system_messages.get(model_category)
+    if system_message is not None:
+        logger.debug(f"🧠 Selected Prompt: '{model_category}' for model '{model_name}'")
     else:
-        system_prompt = fallback_prompt
-        logger.info(f"🧠 Selected Prompt: 'Default/Fallback' for model '{model_name}'")
-    
-    messages = [{"role": "system", "content": system_prompt}]
+        system_message = _fallback_system_message
+        logger.debug(f"🧠 Selected Prompt: 'Default/Fallback' for model '{model_name}'")
     
-    for msg in chat_history:
-        if msg.get("content"):
-            messages.append({"role": msg.get("role"), "content": msg.get("content")})
-            
+    messages = [system_message]
+    messages.extend(
+        {"role": msg.get("role"), "content": content}
+        for msg in chat_history
+        if (content := msg.get("content"))
+    )
     messages.append({"role": "user", "content": user_prompt})
     
     return {
@@ -810,25 +1882,38 @@ def chat_endpoint():
     
     try:
         payload = _prepare_proxy_payload(data, stream)
-        headers = {
-            "Authorization": f"Bearer {PROXY_API_KEY}",
-            "Content-Type": "application/json"
-        }
 
-        response = requests.post(
+        # Serialize with orjson; the session already sends Content-Type: application/json
+        response = proxy_session.post(
             PROXY_URL, 
-            headers=headers, 
-            json=payload, 
-            timeout=120, 
+            data=orjson.dumps(payload), 
+            timeout=(HTTP_CONNECT_TIMEOUT, 120),
             stream=stream
         )
-        response.raise_for_status()
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            # _generate_stream (which closes it) never runs; release the pooled connection here
+            response.close()
+            raise
 
         if stream:
-            return Response(stream_with_context(_generate_stream(response, payload['model'])), content_type='text/plain')
+            return Response(
+                stream_with_context(_generate_stream(response, payload['model'])),
+                content_type='text/event-stream',
+                headers=SSE_HEADERS
+            )
         else:
-            result = response.json()
-            ai_message = result["choices"][0]["message"]["content"]
+            result = orjson.loads(response.content)
+            choices = result.get("choices") if isinstance(result, dict) else None
+            if not choices or not isinstance(choices, list) or not isinstance(choices[0], dict):
+                logger.error(f"AI API Error: response without choices from model '{payload['model']}'")
+                return jsonify({"error": "Upstream response contained no choices"}), 502
+            message = choices[0].get("message")
+            ai_message = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(ai_message, str):
+                logger.error(f"AI API Error: response without message content from model '{payload['model']}'")
+                return jsonify({"error": "Upstream response contained no message content"}), 502
 
             audio_payload = None
             music_request = data.get("music_file")
@@ -858,28 +1943,93 @@ def chat_endpoint():
         logger.error(f"AI API Error: {e}")
         return jsonify({"error": str(e)}), 500
 
-def _generate_stream(response_obj, model_name: str) -> Generator[str, None, None]:
-    """Yields Server-Sent Events (SSE) format data."""
-    full_response = ""
-    for line in response_obj.iter_lines():
-        if line:
-            decoded_line = line.decode('utf-8')
-            if decoded_line.startswith('data: '):
-                data_str = decoded_line[6:]
-                if data_str == '[DONE]':
-                    yield f"data: {json.dumps({'done': True, 'full_response': full_response})}\n\n"
-                    break
-                try:
-                    chunk = json.loads(data_str)
-                    if 'choices' in chunk and chunk['choices']:
-                        delta = chunk['choices'][0].get('delta', {})
-                        if 'content' in delta:
-                            content = delta['content']
-                            full_response += content
-                            yield f"data: {json.dumps({'content': content, 'model': model_name})}\n\n"
-                except json.JSONDecodeError:
-                    continue
+SSE_DATA_PREFIX = b"data: "
+SSE_DONE_MARKER = b"[DONE]"
+# Comment frame sent first so headers reach the client before the model's first token
+SSE_PING = b": ping\n\n"
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def _sse_event(payload: Dict) -> bytes:
+    """Encodes a payload as a single SSE 'data:' frame."""
+    return SSE_DATA_PREFIX + orjson.dumps(payload) + b"\n\n"
+
+SSE_READ_CHUNK_SIZE = 4096
+
+def _iter_sse_lines(response_obj) -> Generator[bytes, None, None]:
+    """
+    Splits the upstream byte stream into lines using a residual buffer.
+    Cheaper than `iter_lines`, which re-scans its pending buffer on every network chunk.
+    """
+    buffer = b""
+    for chunk in response_obj.iter_content(chunk_size=SSE_READ_CHUNK_SIZE):
+        if not chunk:
+            continue
+        buffer += chunk
+        if b"\n" not in chunk:
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+def _iter_sse_data(response_obj) -> Generator[bytes, None, None]:
+    """
+    Groups upstream lines into SSE events (blank-line delimited) and yields each event's
+    data payload. Per the SSE spec the space after 'data:' is optional and multi-line
+    data fields are joined with newlines; comments and other fields are ignored.
+    """
+    data_lines: List[bytes] = []
+    for line in _iter_sse_lines(response_obj):
+        if not line:
+            if data_lines:
+                yield b"\n".join(data_lines)
+                data_lines = []
+        elif line.startswith(b"data:"):
+            value = line[5:]
+            data_lines.append(value[1:] if value.startswith(b" ") else value)
+    if data_lines:
+        yield b"\n".join(data_lines)
+
+def _generate_stream(response_obj, model_name: str) -> Generator[bytes, None, None]:
+    """
+    Yields Server-Sent Events (SSE) frames as bytes, parsing upstream lines without decoding.
+    The upstream response is always closed, so its pooled proxy connection is released even
+    when the client disconnects mid-stream.
+    """
+    full_response = []
+    try:
+        yield SSE_PING
+        for data in _iter_sse_data(response_obj):
+            if data == SSE_DONE_MARKER:
+                yield _sse_event({'done': True, 'full_response': ''.join(full_response)})
+                break
+            try:
+                chunk = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                continue
+            # Valid JSON is not necessarily an object; skip anything that isn't a delta frame
+            if not isinstance(chunk, dict):
+                continue
+            choices = chunk.get('choices')
+            if not choices or not isinstance(choices, list) or not isinstance(choices[0], dict):
+                continue
+            delta = choices[0].get('delta')
+            if not isinstance(delta, dict):
+                continue
+            content = delta.get('content')
+            if content and isinstance(content, str):
+                full_response.append(content)
+                yield _sse_event({'content': content, 'model': model_name})
+    finally:
+        response_obj.close()
 
 if __name__ == "__main__":
+    # Development server only. In production run `gunicorn app:app` (see gunicorn.conf.py).
     logger.info("🚀 Starting WALL•E Backend v2.1.0...")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(
+        debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true',
+        host='0.0.0.0',
+        port=5000,
+        threaded=True
+    )
@@ -0,0 +1,28 @@
+"""
+WALL•E - Gunicorn Configuration
+
+/api/chat holds its worker for the whole LLM round-trip (up to the 120 s proxy
+read timeout) and SSE streams stay open even longer. The work is I/O-bound, so
+requests run on threads (gthread): a waiting thread costs a socket and a stack,
+not a whole process.
+
+Usage: gunicorn app:app   (this file is picked up automatically)
+"""
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Each worker process keeps its own SQLite connections, caches and write-behind queue;
+# keep WEB_CONCURRENCY=1 when WRITE_BEHIND_SAVES is enabled.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# Must exceed the proxy read timeout so slow completions are not killed mid-request
+timeout = 180
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app in each worker: SQLite connections and background threads must not cross fork()
+preload_app = False
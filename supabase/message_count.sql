@@ -0,0 +1,54 @@
+-- WALL•E - Supabase: stored per-chat message counts
+-- Keeps chats.message_count up to date with triggers so the chat list reads a
+-- plain column instead of aggregating messages for every chat. Install once via
+-- the Supabase SQL editor. Without it, the backend falls back to messages(count).
+--
+-- The triggers are statement-level: a save replaces a chat's messages with one
+-- DELETE and one INSERT, so each statement updates the chat row once with the
+-- aggregated delta instead of once per message row.
+
+alter table public.chats
+    add column if not exists message_count integer not null default 0;
+
+drop trigger if exists messages_count_ai on public.messages;
+drop trigger if exists messages_count_ad on public.messages;
+drop function if exists public.chats_track_message_count();
+
+create or replace function public.chats_count_inserted_messages()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.chats c
+    set message_count = c.message_count + inserted.n
+    from (select chat_id, count(*) as n from new_messages group by chat_id) inserted
+    where c.id = inserted.chat_id;
+    return null;
+end;
+$$;
+
+create or replace function public.chats_count_deleted_messages()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.chats c
+    set message_count = c.message_count - deleted.n
+    from (select chat_id, count(*) as n from old_messages group by chat_id) deleted
+    where c.id = deleted.chat_id;
+    return null;
+end;
+$$;
+
+create trigger messages_count_ai
+    after insert on public.messages
+    referencing new table as new_messages
+    for each statement execute function public.chats_count_inserted_messages();
+
+create trigger messages_count_ad
+    after delete on public.messages
+    referencing old table as old_messages
+    for each statement execute function public.chats_count_deleted_messages();
+
+update public.chats c
+set message_count = (select count(*) from public.messages m where m.chat_id = c.id);
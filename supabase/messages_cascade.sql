@@ -0,0 +1,14 @@
+-- WALL•E - Supabase: cascade message deletes
+-- Lets the backend delete a chat with a single request; Postgres removes the
+-- chat's messages through the foreign key. Install once via the Supabase SQL
+-- editor. Without it, deletes fall back to removing messages first.
+
+delete from public.messages m
+where not exists (select 1 from public.chats c where c.id = m.chat_id);
+
+alter table public.messages
+    drop constraint if exists messages_chat_id_fkey;
+
+alter table public.messages
+    add constraint messages_chat_id_fkey
+    foreign key (chat_id) references public.chats (id) on delete cascade;
@@ -0,0 +1,28 @@
+-- WALL•E - Supabase RPC: save_chat_with_messages
+-- Upserts a chat and replaces its messages in a single transaction, so the
+-- backend saves with one HTTP round-trip instead of three.
+-- Install once via the Supabase SQL editor. The backend falls back to the
+-- multi-request path if this function is missing.
+
+create or replace function public.save_chat_with_messages(chat jsonb, msgs jsonb)
+returns void
+language plpgsql
+as $$
+declare
+    new_chat public.chats := jsonb_populate_record(null::public.chats, chat);
+begin
+    insert into public.chats (id, title, model, pinned, created_at)
+    values (new_chat.id, new_chat.title, new_chat.model, new_chat.pinned, new_chat.created_at)
+    on conflict (id) do update set
+        title = excluded.title,
+        model = excluded.model,
+        pinned = excluded.pinned,
+        created_at = excluded.created_at;
+
+    delete from public.messages where chat_id = new_chat.id;
+
+    insert into public.messages (chat_id, role, content, liked, "timestamp")
+    select chat_id, role, content, liked, "timestamp"
+    from jsonb_populate_recordset(null::public.messages, coalesce(msgs, '[]'::jsonb));
+end;
+$$;